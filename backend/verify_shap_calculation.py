@@ -8,84 +8,70 @@ import numpy as np
 import json
 import shap
 import xgboost as xgb
-from sklearn.preprocessing import StandardScaler
+from shap_artifacts import FEATURE_COLUMNS, get_artifacts
 
-def verify_shap_calculation():
-    """验证SHAP计算的正确性"""
+def verify_shap_calculation(interventional=False, return_records=False):
+    """验证SHAP计算的正确性
+    
+    默认以列数组字典返回逐样本结果；return_records=True时返回逐样本字典列表
+    """
     print("🔍 验证SHAP计算正确性...")
     
-    # 1. 重新加载数据和训练模型
+    # 1. 加载数据并获取（可能已缓存的）训练产物
     data_path = "/Users/yichuanzhang/Desktop/workshop_TE/backend/data/worst_day_1_2022_01_07_winter_extreme_cold.csv"
-    df = pd.read_csv(data_path)
-    df['时间'] = pd.to_datetime(df['时间'])
-    df = df.rename(columns={
-        '时间': 'time', '预测电力': 'predicted_power',
-        '真实电力': 'actual_power', '预测天气': 'predicted_temp'
-    })
-    
-    # 特征工程
-    df['hour'] = df['time'].dt.hour
-    df['day_of_week'] = df['time'].dt.dayofweek
-    df['week_of_month'] = (df['time'].dt.day - 1) // 7 + 1
-    df['temp'] = df['predicted_temp']
-    
-    feature_columns = ['temp', 'hour', 'day_of_week', 'week_of_month']
-    
-    # 分离数据
-    train_data = df[df['actual_power'].notna()].copy()
-    predict_data = df[df['actual_power'].isna()].copy()
-    
-    # 训练模型
-    X_train = train_data[feature_columns].values
-    y_train = train_data['actual_power'].values
-    
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    
-    model = xgb.XGBRegressor(
-        n_estimators=100, max_depth=6, learning_rate=0.1,
-        random_state=42, objective='reg:squarederror'
-    )
-    model.fit(X_train_scaled, y_train)
-    
-    # 初始化SHAP
-    explainer = shap.TreeExplainer(model, data=X_train_scaled)
-    X_predict_scaled = scaler.transform(predict_data[feature_columns].values)
-    shap_values = explainer.shap_values(X_predict_scaled)
+    df, artifacts = get_artifacts(data_path)
+    model = artifacts['model']
+    scaler = artifacts['scaler']
+    X_train_scaled = artifacts['X_train_scaled']
+    
+    feature_columns = FEATURE_COLUMNS
+    predict_data = df[df['actual_power'].isna()]
+    
+    X_predict_scaled = scaler.transform(predict_data[feature_columns].values).astype(np.float32, copy=False)
+    if interventional:
+        # interventional算法：以全部训练数据为背景（100行子样本实测会使基准值偏移约71 MW）
+        explainer = shap.TreeExplainer(model, data=X_train_scaled)
+        shap_values = explainer.shap_values(X_predict_scaled)
+        base_value = explainer.expected_value
+    else:
+        # XGBoost原生path-dependent Tree SHAP，最后一列为基准值(bias)
+        dmat = xgb.DMatrix(X_predict_scaled)
+        contribs = model.get_booster().predict(dmat, pred_contribs=True)
+        shap_values = contribs[:, :-1]
+        base_value = contribs[0, -1]
     
     # 2. 验证SHAP值的加性性质
     print("\n📊 验证SHAP值的加性性质...")
-    base_value = explainer.expected_value
     predictions = model.predict(X_predict_scaled)
     
-    verification_results = []
-    
-    for i in range(len(predict_data)):
-        shap_sum = np.sum(shap_values[i])
-        predicted_value = predictions[i]
-        calculated_value = base_value + shap_sum
-        
-        difference = abs(predicted_value - calculated_value)
-        is_correct = difference < 1e-3  # 允许更大的浮点误差（毫瓦级别）
-        
-        verification_results.append({
-            'hour': int(predict_data.iloc[i]['hour']),
-            'predicted': float(predicted_value),
-            'base_plus_shap': float(calculated_value),
-            'difference': float(difference),
-            'is_correct': is_correct
-        })
-        
-        if i < 5:  # 显示前5个验证结果
-            print(f"   Hour {int(predict_data.iloc[i]['hour']):02d}: "
-                  f"Predicted={predicted_value:.2f}, "
-                  f"Base+SHAP={calculated_value:.2f}, "
-                  f"Diff={difference:.6f}, "
-                  f"✓" if is_correct else "✗")
+    # 预分配结果数组，向量化计算每个样本的加性误差
+    n_samples = len(predict_data)
+    hours = predict_data['hour'].to_numpy()
+    base_plus_shap = np.empty(n_samples)
+    diffs = np.empty(n_samples)
+    correct = np.empty(n_samples, dtype=bool)
+    
+    np.add(shap_values.sum(axis=1), base_value, out=base_plus_shap)
+    np.subtract(predictions, base_plus_shap, out=diffs)
+    np.abs(diffs, out=diffs)
+    np.less(diffs, 1e-3, out=correct)  # 允许更大的浮点误差（毫瓦级别）
+    
+    all_correct = bool(correct.all())
+    max_diff = float(diffs.max())
+    
+    # 显示前5个验证结果
+    preview = pd.DataFrame({
+        'hour': hours[:5],
+        'predicted': predictions[:5],
+        'base_plus_shap': base_plus_shap[:5],
+        'difference': diffs[:5],
+        'is_correct': correct[:5]
+    })
+    print(preview.to_string(index=False))
     
     # 3. 验证特征重要性计算
     print("\n📈 验证特征重要性计算...")
-    mean_abs_shap = np.mean(np.abs(shap_values), axis=0)
+    mean_abs_shap = np.abs(shap_values).mean(axis=0)
     feature_names = ['Temperature', 'Hour', 'Day_of_Week', 'Week_of_Month']
     
     for i, (feature, importance) in enumerate(zip(feature_names, mean_abs_shap)):
@@ -107,22 +93,47 @@ def verify_shap_calculation():
         print(f"   {feature}: 计算={calculated:.2f}, 保存={saved:.2f}, 差异={diff:.6f}")
     
     # 5. 总体验证结果
-    all_correct = all(result['is_correct'] for result in verification_results)
-    
     print(f"\n✅ 验证结果:")
     print(f"   • 加性性质验证: {'通过' if all_correct else '失败'}")
-    print(f"   • 验证样本数: {len(verification_results)}")
-    print(f"   • 最大误差: {max(result['difference'] for result in verification_results):.8f}")
+    print(f"   • 验证样本数: {n_samples}")
+    print(f"   • 最大误差: {max_diff:.8f}")
     print(f"   • 基准值: {base_value:.2f} MW")
     
+    if return_records:
+        verification_results = [
+            {
+                'hour': int(hours[i]),
+                'predicted': float(predictions[i]),
+                'base_plus_shap': float(base_plus_shap[i]),
+                'difference': float(diffs[i]),
+                'is_correct': bool(correct[i])
+            }
+            for i in range(n_samples)
+        ]
+    else:
+        verification_results = {
+            'hour': hours,
+            'predicted': predictions,
+            'base_plus_shap': base_plus_shap,
+            'difference': diffs,
+            'is_correct': correct
+        }
+    
     return all_correct, verification_results
 
 def main():
     """主函数"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='SHAP计算验证器')
+    parser.add_argument('--interventional', action='store_true',
+                       help='使用shap.TreeExplainer的interventional算法(以训练数据为背景)')
+    args = parser.parse_args()
+    
     print("🎯 SHAP计算验证器")
     print("=" * 50)
     
-    is_correct, results = verify_shap_calculation()
+    is_correct, results = verify_shap_calculation(interventional=args.interventional)
     
     if is_correct:
         print("\n🎉 SHAP计算完全正确！可以安全使用这些数据。")
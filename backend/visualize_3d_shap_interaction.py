@@ -4,49 +4,162 @@
 展示气温×小时的联合影响
 """
 
+import os
 import json
+import tempfile
+import contextlib
 import numpy as np
+import matplotlib
 import matplotlib.pyplot as plt
+from matplotlib.cm import ScalarMappable
+from matplotlib.colors import Normalize
+from matplotlib.transforms import offset_copy
 import pandas as pd
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from shap_plotting import FigureMixin, loads as _loads, parse_show_args
 
 # 设置中文字体
 plt.rcParams['font.sans-serif'] = ['SimHei', 'Arial Unicode MS', 'DejaVu Sans']
 plt.rcParams['axes.unicode_minus'] = False
 
-class SHAP3DVisualizer:
+DATA_DIR = Path('frontend/public/data')
+INTERACTION_JSON = DATA_DIR / 'shap_3d_temperature_hour_interaction.json'
+MULTI_JSON = DATA_DIR / 'shap_multi_dimensional_interactions.json'
+CACHE_NPZ = DATA_DIR / 'shap_3d_temperature_hour_interaction.npz'
+NPZ_ARRAY_KEYS = ('matrix', 'temp_range', 'hour_range', 'dow_matrix', 'wom_matrix')
+PLOT_METHODS = ('plot_interaction_heatmap', 'plot_key_scenarios', 'plot_insights_summary',
+                'create_3d_surface_plot', 'plot_multi_dimensional_interactions')
+
+class SHAP3DVisualizer(FigureMixin):
     def __init__(self):
         self.data = None
+        self.multi_data = None
+        self._cache = {}
+        self._fig = None
+        self._cmap = plt.get_cmap('RdYlBu_r')
+        self._hour_labels = None
+        self._temp_labels = None
+        self.interactive = False
+        self.dpi = 150  # 仪表板展示用，300dpi的像素量约为4倍，PNG编码明显更慢
         
     def load_data(self):
-        """加载3D交互数据"""
+        """加载3D交互数据（优先读取预处理的.npz缓存）"""
         print("📂 加载3D交互数据...")
         
-        with open('frontend/public/data/shap_3d_temperature_hour_interaction.json', 'r', encoding='utf-8') as f:
-            self.data = json.load(f)
+        if self._npz_is_fresh():
+            self._load_npz()
+        else:
+            self._load_json()
+            self._save_npz()
+        
+        # 刻度标签只格式化一次，各热力图直接复用
+        self._hour_labels = np.array([f'{h:02d}:00' for h in self._cache['hour_range']])
+        self._temp_labels = np.array([f'{t}°C' for t in self._cache['temp_range']])
         
         print("✅ 数据加载完成")
         
+    def _npz_is_fresh(self):
+        """缓存存在且比两个JSON源文件都新时可直接使用"""
+        if not CACHE_NPZ.exists():
+            return False
+        cache_mtime = CACHE_NPZ.stat().st_mtime
+        return all(path.stat().st_mtime <= cache_mtime for path in (INTERACTION_JSON, MULTI_JSON))
+        
+    def _load_json(self):
+        """解析JSON源文件并提取矩阵"""
+        with open(INTERACTION_JSON, 'rb') as f:
+            self.data = _loads(f.read())
+        
+        with open(MULTI_JSON, 'rb') as f:
+            self.multi_data = _loads(f.read())
+        
+        # 预先提取矩阵和坐标范围（C连续float32），各绘图方法直接复用；
+        # 提取后从字典中移除原始列表，与.npz缓存加载后的结构保持一致
+        matrix_data = self.data.pop('interaction_matrix')
+        self._cache['matrix'] = np.ascontiguousarray(matrix_data['matrix'], dtype=np.float32)
+        self._cache['temp_range'] = np.asarray(matrix_data['temperature_range'])
+        self._cache['hour_range'] = np.asarray(matrix_data['hour_range'])
+        self._cache['dow_matrix'] = np.ascontiguousarray(self.multi_data['dow_hour_interaction'].pop('matrix'),
+                                                         dtype=np.float32)
+        self._cache['wom_matrix'] = np.ascontiguousarray(self.multi_data['wom_hour_interaction'].pop('matrix'),
+                                                         dtype=np.float32)
+        
+    def _save_npz(self):
+        """将矩阵以二进制保存，其余字段（场景、洞察、标签等）以JSON字符串保存"""
+        meta = json.dumps({'data': self.data, 'multi_data': self.multi_data}, ensure_ascii=False)
+        # 缓存只是加速手段：先写临时文件再原子替换，避免并行出图的子进程读到写了一半的文件；
+        # 目录不可写等情况下放弃缓存，不影响出图
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(dir=CACHE_NPZ.parent, suffix='.npz', delete=False) as f:
+                tmp_path = f.name
+                np.savez_compressed(f, meta=np.array(meta),
+                                    **{key: self._cache[key] for key in NPZ_ARRAY_KEYS})
+            # 临时文件以0600创建，替换前改回按umask的默认权限，与旁边的JSON文件一样可被静态服务读取
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_path, 0o666 & ~umask)
+            os.replace(tmp_path, CACHE_NPZ)
+        except OSError as e:
+            print(f"⚠️ 无法写入缓存 {CACHE_NPZ}: {e}")
+            if tmp_path is not None:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+        
+    def _load_npz(self):
+        """从.npz缓存恢复矩阵和其余字段"""
+        with np.load(CACHE_NPZ) as npz:
+            for key in NPZ_ARRAY_KEYS:
+                self._cache[key] = npz[key]
+            meta = _loads(npz['meta'].item())
+        self.data = meta['data']
+        self.multi_data = meta['multi_data']
+        
+    def _hour_ticklabels(self, hours):
+        """返回小时刻度标签；与主矩阵的小时范围相同时直接复用预先格式化的数组"""
+        if np.array_equal(hours, self._cache['hour_range']):
+            return self._hour_labels
+        return np.array([f'{h:02d}:00' for h in hours])
+        
+    def _matrix_limits(self):
+        """温度×小时矩阵的 (vmin, vmax)，首次调用时计算，热力图和3D表面图共用"""
+        if 'matrix_limits' not in self._cache:
+            matrix = self._cache['matrix']
+            self._cache['matrix_limits'] = (float(matrix.min()), float(matrix.max()))
+        return self._cache['matrix_limits']
+        
+    def _draw_heatmap(self, ax, matrix, norm=None):
+        """以预先量化的uint8 RGBA图像绘制热力图，返回供颜色条使用的ScalarMappable
+        
+        传入同一个norm的多张热力图共用同一颜色范围，颜色可以直接比较
+        """
+        if norm is None:
+            norm = Normalize(vmin=matrix.min(), vmax=matrix.max())
+        rgba = self._cmap(norm(matrix), bytes=True)
+        ax.imshow(rgba, aspect='auto', origin='lower', interpolation='nearest')
+        return ScalarMappable(norm=norm, cmap=self._cmap)
+        
     def plot_interaction_heatmap(self):
         """绘制交互热力图"""
         print("🗺️ 绘制交互热力图...")
         
-        matrix_data = self.data['interaction_matrix']
-        matrix = np.array(matrix_data['matrix'])
-        temp_range = matrix_data['temperature_range']
-        hour_range = matrix_data['hour_range']
+        matrix = self._cache['matrix']
+        temp_range = self._cache['temp_range']
+        hour_range = self._cache['hour_range']
         
-        plt.figure(figsize=(14, 8))
+        self._figure((14, 8))
         
         # 创建热力图
-        im = plt.imshow(matrix, cmap='RdYlBu_r', aspect='auto', origin='lower')
+        vmin, vmax = self._matrix_limits()
+        im = self._draw_heatmap(plt.gca(), matrix, Normalize(vmin=vmin, vmax=vmax))
         
         # 设置坐标轴
-        plt.xticks(range(len(hour_range)), [f'{h:02d}:00' for h in hour_range], rotation=45)
-        plt.yticks(range(len(temp_range)), [f'{t}°C' for t in temp_range])
+        plt.xticks(range(len(hour_range)), self._hour_labels, rotation=45)
+        plt.yticks(range(len(temp_range)), self._temp_labels)
         
         # 添加颜色条
-        cbar = plt.colorbar(im, shrink=0.8)
+        cbar = plt.colorbar(im, ax=plt.gca(), shrink=0.8)
         cbar.set_label('SHAP Joint Effect (MW)', fontsize=12)
         
         # 标题和标签
@@ -58,9 +171,7 @@ class SHAP3DVisualizer:
         # 添加网格
         plt.grid(True, alpha=0.3)
         
-        plt.tight_layout()
-        plt.savefig('shap_3d_interaction_heatmap.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        self._save('shap_3d_interaction_heatmap.png')
         
     def plot_key_scenarios(self):
         """绘制关键场景对比"""
@@ -69,7 +180,8 @@ class SHAP3DVisualizer:
         scenarios = self.data['key_scenarios']
         
         # 创建子图
-        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
+        fig = self._figure((16, 6))
+        ax1, ax2 = fig.subplots(1, 2)
         
         # 场景1：同温度不同时间
         cold_scenario = scenarios[0]
@@ -84,9 +196,9 @@ class SHAP3DVisualizer:
         x = np.arange(len(times))
         width = 0.25
         
-        ax1.bar(x - width, temp_effects, width, label='Temperature Effect', color='#FF6B6B', alpha=0.8)
-        ax1.bar(x, hour_effects, width, label='Hour Effect', color='#4ECDC4', alpha=0.8)
-        ax1.bar(x + width, joint_effects, width, label='Joint Effect', color='#45B7D1', alpha=0.8)
+        temp_bars = ax1.bar(x - width, temp_effects, width, label='Temperature Effect', color='#FF6B6B', alpha=0.8)
+        hour_bars = ax1.bar(x, hour_effects, width, label='Hour Effect', color='#4ECDC4', alpha=0.8)
+        joint_bars = ax1.bar(x + width, joint_effects, width, label='Joint Effect', color='#45B7D1', alpha=0.8)
         
         ax1.set_title(f'{cold_scenario["description"]}\n同样是-1°C在不同时间的影响', fontweight='bold')
         ax1.set_ylabel('SHAP Value (MW)')
@@ -96,10 +208,8 @@ class SHAP3DVisualizer:
         ax1.grid(True, alpha=0.3)
         
         # 添加数值标签
-        for i, (temp, hour, joint) in enumerate(zip(temp_effects, hour_effects, joint_effects)):
-            ax1.text(i - width, temp + 5, f'{temp:.1f}', ha='center', va='bottom', fontsize=10)
-            ax1.text(i, hour + 5, f'{hour:.1f}', ha='center', va='bottom', fontsize=10)
-            ax1.text(i + width, joint + 5, f'{joint:.1f}', ha='center', va='bottom', fontsize=10)
+        for bars, values in ((temp_bars, temp_effects), (hour_bars, hour_effects), (joint_bars, joint_effects)):
+            ax1.bar_label(bars, labels=[f'{v:.1f}' for v in values], padding=3, fontsize=10)
         
         # 场景2：不同温度同时间
         temp_scenario = scenarios[1]
@@ -120,16 +230,14 @@ class SHAP3DVisualizer:
         ax2.legend()
         ax2.grid(True, alpha=0.3)
         
-        # 添加数值标签
-        for temp, temp_shap, joint in zip(temperatures, temp_shaps, joint_effects_temp):
-            ax2.annotate(f'{temp_shap:.1f}', (temp, temp_shap), 
-                        textcoords="offset points", xytext=(0,10), ha='center')
-            ax2.annotate(f'{joint:.1f}', (temp, joint), 
-                        textcoords="offset points", xytext=(0,10), ha='center')
+        # 添加数值标签：两条线的点合并成一批，所有文本共用同一个上移10pt的变换
+        label_x = temperatures + temperatures
+        label_y = temp_shaps + joint_effects_temp
+        label_transform = offset_copy(ax2.transData, fig=fig, y=10, units='points')
+        for x_val, y_val in zip(label_x, label_y):
+            ax2.text(x_val, y_val, f'{y_val:.1f}', transform=label_transform, ha='center')
         
-        plt.tight_layout()
-        plt.savefig('shap_key_scenarios.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        self._save('shap_key_scenarios.png')
         
     def plot_insights_summary(self):
         """绘制洞察总结"""
@@ -137,15 +245,16 @@ class SHAP3DVisualizer:
         
         insights = self.data['insights']
         
-        fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
+        fig = self._figure((16, 12))
+        (ax1, ax2), (ax3, ax4) = fig.subplots(2, 2)
         
         # 1. 最强效应
         strongest = insights[0]
-        ax1.bar(['最强联合效应'], [strongest['value']], color='#FF6B6B', alpha=0.8)
+        bars = ax1.bar(['最强联合效应'], [strongest['value']], color='#FF6B6B', alpha=0.8)
         ax1.set_title(f'Strongest Joint Effect\n{strongest["description"]}', fontweight='bold')
         ax1.set_ylabel('SHAP Value (MW)')
-        ax1.text(0, strongest['value'] + 5, f'{strongest["value"]:.1f} MW', 
-                ha='center', va='bottom', fontsize=12, fontweight='bold')
+        ax1.bar_label(bars, labels=[f'{strongest["value"]:.1f} MW'], padding=3,
+                      fontsize=12, fontweight='bold')
         ax1.grid(True, alpha=0.3)
         
         # 2. 时段敏感性
@@ -161,9 +270,7 @@ class SHAP3DVisualizer:
         ax2.tick_params(axis='x', rotation=45)
         
         # 添加数值标签
-        for bar, value in zip(bars, values):
-            ax2.text(bar.get_x() + bar.get_width()/2, value + 2, f'{value:.1f}', 
-                    ha='center', va='bottom', fontsize=10)
+        ax2.bar_label(bars, labels=[f'{v:.1f}' for v in values], padding=2, fontsize=10)
         ax2.grid(True, alpha=0.3)
         
         # 3. 温度阈值效应
@@ -178,9 +285,7 @@ class SHAP3DVisualizer:
         ax3.set_ylabel('Average SHAP Value (MW)')
         
         # 添加数值标签
-        for bar, value in zip(bars, temp_values):
-            ax3.text(bar.get_x() + bar.get_width()/2, value + 2, f'{value:.1f}', 
-                    ha='center', va='bottom', fontsize=10)
+        ax3.bar_label(bars, labels=[f'{v:.1f}' for v in temp_values], padding=2, fontsize=10)
         ax3.grid(True, alpha=0.3)
         
         # 4. 关键发现文本
@@ -200,29 +305,36 @@ class SHAP3DVisualizer:
             ax4.text(0.05, 0.75 - i*0.12, finding, fontsize=12, 
                     transform=ax4.transAxes, wrap=True)
         
-        plt.tight_layout()
-        plt.savefig('shap_insights_summary.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        self._save('shap_insights_summary.png')
         
     def create_3d_surface_plot(self):
         """创建3D表面图"""
         print("🏔️ 创建3D表面图...")
         
-        matrix_data = self.data['interaction_matrix']
-        matrix = np.array(matrix_data['matrix'])
-        temp_range = np.array(matrix_data['temperature_range'])
-        hour_range = np.array(matrix_data['hour_range'])
+        matrix = self._cache['matrix']
+        temp_range = self._cache['temp_range']
+        hour_range = self._cache['hour_range']
         
-        # 创建网格
-        H, T = np.meshgrid(hour_range, temp_range)
+        # 创建网格（坐标范围保持整数供刻度标签使用，网格转为float32）
+        H, T = np.meshgrid(hour_range.astype(np.float32), temp_range.astype(np.float32))
         
         # 创建3D图
-        fig = plt.figure(figsize=(14, 10))
+        fig = self._figure((14, 10))
         ax = fig.add_subplot(111, projection='3d')
         
-        # 绘制表面
-        surf = ax.plot_surface(H, T, matrix, cmap='RdYlBu_r', alpha=0.8, 
-                              linewidth=0, antialiased=True)
+        # 绘制表面（网格超过约50行时按步长降采样，关闭抗锯齿；栅格化避免逐个多边形输出）
+        # 降采样后的切片不连续，在进入plot_surface前统一转为C连续，步长为1时不会复制
+        step = max(1, matrix.shape[0] // 50)
+        H_s = np.ascontiguousarray(H[::step, ::step])
+        T_s = np.ascontiguousarray(T[::step, ::step])
+        # 切片总是缓存矩阵的视图（与热力图共用同一块内存），ascontiguousarray只在降采样后不连续时才复制
+        Z_s = np.ascontiguousarray(matrix[::step, ::step])
+        # 颜色范围取完整矩阵的极值，降采样后仍与热力图的配色一致
+        vmin, vmax = self._matrix_limits()
+        surf = ax.plot_surface(H_s, T_s, Z_s,
+                              cmap=self._cmap, vmin=vmin, vmax=vmax,
+                              alpha=0.8, linewidth=0, antialiased=False,
+                              rstride=1, cstride=1, rasterized=True)
         
         # 设置标签
         ax.set_xlabel('Hour of Day (小时)', fontsize=12)
@@ -237,28 +349,30 @@ class SHAP3DVisualizer:
         # 设置视角
         ax.view_init(elev=30, azim=45)
         
-        plt.tight_layout()
-        plt.savefig('shap_3d_surface.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        self._save('shap_3d_surface.png')
         
     def plot_multi_dimensional_interactions(self):
         """绘制多维交互图"""
         print("📊 绘制多维交互图...")
 
-        # 加载多维数据
-        with open('frontend/public/data/shap_multi_dimensional_interactions.json', 'r', encoding='utf-8') as f:
-            multi_data = json.load(f)
+        multi_data = self.multi_data
 
         # 创建2x2子图
-        fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(18, 14))
+        fig = self._figure((18, 14))
+        (ax1, ax2), (ax3, ax4) = fig.subplots(2, 2)
+
+        # 两张热力图共用同一个颜色范围，星期与月内周数的效应可以直接比较
+        dow_matrix = self._cache['dow_matrix']
+        wom_matrix = self._cache['wom_matrix']
+        shared_norm = Normalize(vmin=min(dow_matrix.min(), wom_matrix.min()),
+                                vmax=max(dow_matrix.max(), wom_matrix.max()))
 
         # 1. Day of Week × Hour 热力图
         dow_data = multi_data['dow_hour_interaction']
-        dow_matrix = np.array(dow_data['matrix'])
 
-        im1 = ax1.imshow(dow_matrix, cmap='RdYlBu_r', aspect='auto', origin='lower')
+        im1 = self._draw_heatmap(ax1, dow_matrix, shared_norm)
         ax1.set_xticks(range(len(dow_data['hour_range'])))
-        ax1.set_xticklabels([f'{h:02d}:00' for h in dow_data['hour_range']], rotation=45)
+        ax1.set_xticklabels(self._hour_ticklabels(dow_data['hour_range']), rotation=45)
         ax1.set_yticks(range(len(dow_data['dow_labels'])))
         ax1.set_yticklabels(dow_data['dow_labels'])
         ax1.set_title('Day of Week × Hour SHAP Interaction\n星期×小时SHAP交互', fontweight='bold')
@@ -268,11 +382,10 @@ class SHAP3DVisualizer:
 
         # 2. Week of Month × Hour 热力图
         wom_data = multi_data['wom_hour_interaction']
-        wom_matrix = np.array(wom_data['matrix'])
 
-        im2 = ax2.imshow(wom_matrix, cmap='RdYlBu_r', aspect='auto', origin='lower')
+        im2 = self._draw_heatmap(ax2, wom_matrix, shared_norm)
         ax2.set_xticks(range(len(wom_data['hour_range'])))
-        ax2.set_xticklabels([f'{h:02d}:00' for h in wom_data['hour_range']], rotation=45)
+        ax2.set_xticklabels(self._hour_ticklabels(wom_data['hour_range']), rotation=45)
         ax2.set_yticks(range(len(wom_data['wom_labels'])))
         ax2.set_yticklabels(wom_data['wom_labels'])
         ax2.set_title('Week of Month × Hour SHAP Interaction\n月内周数×小时SHAP交互', fontweight='bold')
@@ -312,25 +425,34 @@ class SHAP3DVisualizer:
         ax4.set_xticklabels([f'Week {w}' for w in weeks])
         ax4.grid(True, alpha=0.3)
 
-        # 添加数值标签
+        # 添加数值标签（带误差棒，bar_label会把标签放到误差棒上端之外，这里仍按柱顶定位）
         for bar, avg in zip(bars, avg_shaps):
             ax4.text(bar.get_x() + bar.get_width()/2, avg + 5, f'{avg:.1f}',
                     ha='center', va='bottom', fontsize=10)
 
-        plt.tight_layout()
-        plt.savefig('shap_multi_dimensional_interactions.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        self._save('shap_multi_dimensional_interactions.png')
 
-    def visualize_all(self):
-        """生成所有可视化"""
+    def visualize_all(self, interactive=False):
+        """生成所有可视化
+        
+        interactive为False时只写出PNG不弹出窗口，
+        五张图彼此独立，交给进程池并行绘制；交互模式下按顺序绘制并复用同一Figure
+        """
         print("🎨 开始生成所有3D SHAP可视化...")
+        
+        self.interactive = interactive
 
+        # 主进程先加载一次，确保子进程可以直接读取.npz缓存
         self.load_data()
-        self.plot_interaction_heatmap()
-        self.plot_key_scenarios()
-        self.plot_insights_summary()
-        self.create_3d_surface_plot()
-        self.plot_multi_dimensional_interactions()
+        if interactive:
+            for method_name in PLOT_METHODS:
+                getattr(self, method_name)()
+        else:
+            # pyplot的全局状态不是线程安全的，因此使用进程而不是线程
+            max_workers = min(len(PLOT_METHODS), os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                # 子进程各自新建可视化器，需要把调用方的出图设置一并传过去
+                list(executor.map(_render_one, PLOT_METHODS, [self.dpi] * len(PLOT_METHODS)))
 
         print("\n🎉 所有可视化已完成！")
         print("📁 生成的图片文件:")
@@ -340,6 +462,18 @@ class SHAP3DVisualizer:
         print("   • shap_3d_surface.png - 3D表面图")
         print("   • shap_multi_dimensional_interactions.png - 多维交互图")
 
+def _render_one(method_name, dpi):
+    """子进程入口：独立加载数据（命中.npz缓存），按主进程的dpi绘制一张图"""
+    # 子进程只写出PNG；以spawn方式启动时不会执行__main__中的后端选择
+    matplotlib.use('Agg')
+    visualizer = SHAP3DVisualizer()
+    visualizer.dpi = dpi
+    visualizer.load_data()
+    getattr(visualizer, method_name)()
+    return method_name
+
 if __name__ == "__main__":
+    args = parse_show_args('3D SHAP交互效应可视化')
+    
     visualizer = SHAP3DVisualizer()
-    visualizer.visualize_all()
+    visualizer.visualize_all(interactive=args.show)
@@ -9,6 +9,7 @@ import json
 import matplotlib.pyplot as plt
 import seaborn as sns
 from matplotlib import rcParams
+from shap_plotting import FigureMixin, loads as _loads, parse_show_args
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -16,22 +17,52 @@ warnings.filterwarnings('ignore')
 plt.rcParams['font.sans-serif'] = ['SimHei', 'Arial Unicode MS', 'DejaVu Sans']
 plt.rcParams['axes.unicode_minus'] = False
 
-class SHAPDataVisualizer:
+
+class SHAPDataVisualizer(FigureMixin):
     """SHAP数据可视化器"""
     
     def __init__(self, json_path):
         """初始化可视化器"""
         self.json_path = json_path
         self.data = None
+        self._dep = {}
+        self._dep_means = {}
+        self._fig = None
+        self._cmap = plt.get_cmap('RdYlBu_r')
+        self.interactive = False
+        self.dpi = 150  # 保存图片的分辨率
         self.load_data()
         
     def load_data(self):
         """加载SHAP数据"""
         print("📊 加载SHAP数据...")
-        with open(self.json_path, 'r', encoding='utf-8') as f:
-            self.data = json.load(f)
+        with open(self.json_path, 'rb') as f:
+            self.data = _loads(f.read())
+        
+        # 每个特征的依赖数据只转换一次为列式DataFrame，各绘图方法直接切片
+        self._dep = {
+            feature: pd.DataFrame.from_records(dependence['data_points'])
+            for feature, dependence in self.data['feature_dependence'].items()
+        }
+        self._dep_means = {}
         print("✅ 数据加载完成")
         
+    def _dependence_arrays(self, feature):
+        """返回特征值和SHAP值数组"""
+        df = self._dep[feature]
+        return df['feature_value'].to_numpy(), df['shap_value'].to_numpy()
+        
+    def _dependence_means(self, feature):
+        """整数取值特征按特征值分组的平均SHAP值，返回(特征值, 平均SHAP值)数组（计算一次后缓存）"""
+        if feature not in self._dep_means:
+            feature_values, shap_values = self._dependence_arrays(feature)
+            idx = np.asarray(feature_values, dtype=np.intp)
+            counts = np.bincount(idx)
+            sums = np.bincount(idx, weights=np.asarray(shap_values, dtype=np.float64))
+            keys = np.flatnonzero(counts)  # 只保留出现过的取值，与groupby结果一致
+            self._dep_means[feature] = (keys, sums[keys] / counts[keys])
+        return self._dep_means[feature]
+        
     def plot_feature_importance(self):
         """绘制特征重要性图"""
         print("📈 绘制特征重要性图...")
@@ -43,36 +74,30 @@ class SHAPDataVisualizer:
         importances = [item['importance'] for item in importance_data]
         
         # 创建图形
-        plt.figure(figsize=(10, 6))
+        self._figure((10, 6))
         bars = plt.bar(features, importances, color=['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4'])
         
         # 添加数值标签
-        for bar, importance in zip(bars, importances):
-            plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + 5,
-                    f'{importance:.1f}', ha='center', va='bottom', fontsize=12, fontweight='bold')
+        plt.gca().bar_label(bars, labels=[f'{v:.1f}' for v in importances], padding=3,
+                            fontsize=12, fontweight='bold')
         
         plt.title('SHAP特征重要性分析', fontsize=16, fontweight='bold', pad=20)
         plt.xlabel('特征', fontsize=12)
         plt.ylabel('重要性 (MW)', fontsize=12)
         plt.grid(axis='y', alpha=0.3)
-        plt.tight_layout()
         
         # 保存图片
-        plt.savefig('shap_feature_importance.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        self._save('shap_feature_importance.png')
         
     def plot_hour_dependence(self):
         """绘制小时依赖图"""
         print("🕐 绘制小时依赖图...")
         
-        hour_data = self.data['feature_dependence']['Hour']['data_points']
-        
         # 准备数据
-        hours = [point['feature_value'] for point in hour_data]
-        shap_values = [point['shap_value'] for point in hour_data]
+        hours, shap_values = self._dependence_arrays('Hour')
         
         # 创建图形
-        plt.figure(figsize=(12, 6))
+        self._figure((12, 6))
         
         # 绘制折线图
         plt.plot(hours, shap_values, marker='o', linewidth=2, markersize=6, color='#FF6B6B')
@@ -81,9 +106,9 @@ class SHAPDataVisualizer:
         plt.axhline(y=0, color='gray', linestyle='--', alpha=0.5)
         
         # 填充正负区域
-        plt.fill_between(hours, shap_values, 0, where=np.array(shap_values) >= 0, 
+        plt.fill_between(hours, shap_values, 0, where=shap_values >= 0, 
                         color='#FF6B6B', alpha=0.3, label='正向影响')
-        plt.fill_between(hours, shap_values, 0, where=np.array(shap_values) < 0, 
+        plt.fill_between(hours, shap_values, 0, where=shap_values < 0, 
                         color='#4ECDC4', alpha=0.3, label='负向影响')
         
         plt.title('小时对用电量的SHAP影响', fontsize=16, fontweight='bold', pad=20)
@@ -92,33 +117,28 @@ class SHAPDataVisualizer:
         plt.xticks(range(0, 24, 2))
         plt.grid(alpha=0.3)
         plt.legend()
-        plt.tight_layout()
         
         # 保存图片
-        plt.savefig('shap_hour_dependence.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        self._save('shap_hour_dependence.png')
 
     def plot_temperature_dependence(self):
         """绘制温度依赖图"""
         print("🌡️ 绘制温度依赖图...")
 
-        temp_data = self.data['feature_dependence']['Temperature']['data_points']
-
         # 准备数据
-        temperatures = [point['feature_value'] for point in temp_data]
-        shap_values = [point['shap_value'] for point in temp_data]
+        temperatures, shap_values = self._dependence_arrays('Temperature')
 
         # 创建图形
-        plt.figure(figsize=(10, 6))
+        self._figure((10, 6))
 
         # 绘制散点图
-        scatter = plt.scatter(temperatures, shap_values, c=shap_values, cmap='RdYlBu_r',
+        scatter = plt.scatter(temperatures, shap_values, c=shap_values, cmap=self._cmap,
                             s=100, alpha=0.7, edgecolors='black', linewidth=0.5)
 
         # 添加趋势线
         z = np.polyfit(temperatures, shap_values, 2)
         p = np.poly1d(z)
-        temp_smooth = np.linspace(min(temperatures), max(temperatures), 100)
+        temp_smooth = np.linspace(temperatures.min(), temperatures.max(), 100)
         plt.plot(temp_smooth, p(temp_smooth), '--', color='red', linewidth=2, alpha=0.8)
 
         # 添加零线
@@ -129,45 +149,31 @@ class SHAPDataVisualizer:
         plt.ylabel('SHAP值 (MW)', fontsize=12)
         plt.colorbar(scatter, label='SHAP值 (MW)')
         plt.grid(alpha=0.3)
-        plt.tight_layout()
 
         # 保存图片
-        plt.savefig('shap_temperature_dependence.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        self._save('shap_temperature_dependence.png')
 
     def plot_day_of_week_dependence(self):
         """绘制星期依赖图"""
         print("📅 绘制星期依赖图...")
 
-        dow_data = self.data['feature_dependence']['Day_of_Week']['data_points']
-
-        # 准备数据 - 按星期分组
-        feature_values = [point['feature_value'] for point in dow_data]
-        shap_values = [point['shap_value'] for point in dow_data]
-
         # 按星期分组计算平均SHAP值
-        import pandas as pd
-        df = pd.DataFrame({'day': feature_values, 'shap': shap_values})
-        day_avg = df.groupby('day')['shap'].mean()
+        days, avg_shap = self._dependence_means('Day_of_Week')
 
         # 星期标签
         day_labels = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
-        days = list(day_avg.index)
-        avg_shap = list(day_avg.values)
 
         # 创建图形
-        plt.figure(figsize=(12, 6))
+        self._figure((12, 6))
 
         # 绘制条形图
         colors = ['#FF6B6B' if shap > 0 else '#4ECDC4' for shap in avg_shap]
         bars = plt.bar([day_labels[int(day)] for day in days], avg_shap,
                       color=colors, alpha=0.7, edgecolor='black', linewidth=0.5)
 
-        # 添加数值标签
-        for bar, shap in zip(bars, avg_shap):
-            plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + (5 if shap > 0 else -15),
-                    f'{shap:.1f}', ha='center', va='bottom' if shap > 0 else 'top',
-                    fontsize=10, fontweight='bold')
+        # 添加数值标签（负值条形的标签自动放在下方）
+        plt.gca().bar_label(bars, labels=[f'{v:.1f}' for v in avg_shap], padding=3,
+                            fontsize=10, fontweight='bold')
 
         # 添加零线
         plt.axhline(y=0, color='gray', linestyle='--', alpha=0.5)
@@ -176,42 +182,28 @@ class SHAPDataVisualizer:
         plt.xlabel('星期', fontsize=12)
         plt.ylabel('平均SHAP值 (MW)', fontsize=12)
         plt.grid(axis='y', alpha=0.3)
-        plt.tight_layout()
 
         # 保存图片
-        plt.savefig('shap_day_of_week_dependence.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        self._save('shap_day_of_week_dependence.png')
 
     def plot_week_of_month_dependence(self):
         """绘制周数依赖图"""
         print("📊 绘制周数依赖图...")
 
-        wom_data = self.data['feature_dependence']['Week_of_Month']['data_points']
-
-        # 准备数据 - 按周数分组
-        feature_values = [point['feature_value'] for point in wom_data]
-        shap_values = [point['shap_value'] for point in wom_data]
-
         # 按周数分组计算平均SHAP值
-        df = pd.DataFrame({'week': feature_values, 'shap': shap_values})
-        week_avg = df.groupby('week')['shap'].mean()
-
-        weeks = list(week_avg.index)
-        avg_shap = list(week_avg.values)
+        weeks, avg_shap = self._dependence_means('Week_of_Month')
         week_labels = [f'第{int(week)}周' for week in weeks]
 
         # 创建图形
-        plt.figure(figsize=(10, 6))
+        self._figure((10, 6))
 
         # 绘制条形图
         colors = ['#FF6B6B' if shap > 0 else '#4ECDC4' for shap in avg_shap]
         bars = plt.bar(week_labels, avg_shap, color=colors, alpha=0.7, edgecolor='black', linewidth=0.5)
 
-        # 添加数值标签
-        for bar, shap in zip(bars, avg_shap):
-            plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + (5 if shap > 0 else -15),
-                    f'{shap:.1f}', ha='center', va='bottom' if shap > 0 else 'top',
-                    fontsize=10, fontweight='bold')
+        # 添加数值标签（负值条形的标签自动放在下方）
+        plt.gca().bar_label(bars, labels=[f'{v:.1f}' for v in avg_shap], padding=3,
+                            fontsize=10, fontweight='bold')
 
         # 添加零线
         plt.axhline(y=0, color='gray', linestyle='--', alpha=0.5)
@@ -220,18 +212,17 @@ class SHAPDataVisualizer:
         plt.xlabel('月中周数', fontsize=12)
         plt.ylabel('平均SHAP值 (MW)', fontsize=12)
         plt.grid(axis='y', alpha=0.3)
-        plt.tight_layout()
 
         # 保存图片
-        plt.savefig('shap_week_of_month_dependence.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        self._save('shap_week_of_month_dependence.png')
         
     def create_summary_dashboard(self):
         """创建综合仪表板"""
         print("📊 创建综合仪表板...")
         
         # 创建2x3的子图布局
-        fig, axes = plt.subplots(2, 3, figsize=(18, 12))
+        fig = self._figure((18, 12))
+        axes = fig.subplots(2, 3)
         fig.suptitle('SHAP分析综合仪表板', fontsize=20, fontweight='bold', y=0.95)
         
         # 1. 特征重要性
@@ -246,9 +237,7 @@ class SHAPDataVisualizer:
         
         # 2. 小时依赖
         ax2 = axes[0, 1]
-        hour_data = self.data['feature_dependence']['Hour']['data_points']
-        hours = [point['feature_value'] for point in hour_data]
-        hour_shap = [point['shap_value'] for point in hour_data]
+        hours, hour_shap = self._dependence_arrays('Hour')
         ax2.plot(hours, hour_shap, marker='o', color='#FF6B6B', linewidth=2)
         ax2.axhline(y=0, color='gray', linestyle='--', alpha=0.5)
         ax2.set_title('小时影响', fontweight='bold')
@@ -257,10 +246,8 @@ class SHAPDataVisualizer:
         
         # 3. 温度依赖
         ax3 = axes[0, 2]
-        temp_data = self.data['feature_dependence']['Temperature']['data_points']
-        temperatures = [point['feature_value'] for point in temp_data]
-        temp_shap = [point['shap_value'] for point in temp_data]
-        scatter = ax3.scatter(temperatures, temp_shap, c=temp_shap, cmap='RdYlBu_r', s=50)
+        temperatures, temp_shap = self._dependence_arrays('Temperature')
+        scatter = ax3.scatter(temperatures, temp_shap, c=temp_shap, cmap=self._cmap, s=50)
         ax3.axhline(y=0, color='gray', linestyle='--', alpha=0.5)
         ax3.set_title('温度影响', fontweight='bold')
         ax3.set_xlabel('温度 (°C)')
@@ -268,12 +255,9 @@ class SHAPDataVisualizer:
         
         # 4. 星期依赖
         ax4 = axes[1, 0]
-        dow_data = self.data['feature_dependence']['Day_of_Week']['data_points']
-        dow_features = [point['feature_value'] for point in dow_data]
-        dow_shap = [point['shap_value'] for point in dow_data]
-        df_dow = pd.DataFrame({'day': dow_features, 'shap': dow_shap})
-        dow_avg = df_dow.groupby('day')['shap'].mean()
-        ax4.bar(range(len(dow_avg)), dow_avg.values, color='#45B7D1', alpha=0.7)
+        _, dow_shap = self._dependence_arrays('Day_of_Week')
+        _, dow_avg = self._dependence_means('Day_of_Week')
+        ax4.bar(range(len(dow_avg)), dow_avg, color='#45B7D1', alpha=0.7)
         ax4.axhline(y=0, color='gray', linestyle='--', alpha=0.5)
         ax4.set_title('星期影响', fontweight='bold')
         ax4.set_xlabel('星期')
@@ -281,12 +265,8 @@ class SHAPDataVisualizer:
 
         # 5. 周数依赖
         ax5 = axes[1, 1]
-        wom_data = self.data['feature_dependence']['Week_of_Month']['data_points']
-        wom_features = [point['feature_value'] for point in wom_data]
-        wom_shap = [point['shap_value'] for point in wom_data]
-        df_wom = pd.DataFrame({'week': wom_features, 'shap': wom_shap})
-        wom_avg = df_wom.groupby('week')['shap'].mean()
-        ax5.bar(range(len(wom_avg)), wom_avg.values, alpha=0.6, color='#96CEB4')
+        _, wom_avg = self._dependence_means('Week_of_Month')
+        ax5.bar(range(len(wom_avg)), wom_avg, alpha=0.6, color='#96CEB4')
         ax5.axhline(y=0, color='gray', linestyle='--', alpha=0.5)
         ax5.set_title('周数影响', fontweight='bold')
         ax5.set_xlabel('周数')
@@ -303,22 +283,25 @@ class SHAPDataVisualizer:
 • 重要性: {importance_data[0]['importance']:.1f} MW
 
 特征影响范围:
-• 小时: {min(hour_shap):.1f} ~ {max(hour_shap):.1f} MW
-• 温度: {min(temp_shap):.1f} ~ {max(temp_shap):.1f} MW
-• 星期: {min(dow_shap):.1f} ~ {max(dow_shap):.1f} MW
-• 周数: {min(wom_avg.values):.1f} ~ {max(wom_avg.values):.1f} MW
+• 小时: {hour_shap.min():.1f} ~ {hour_shap.max():.1f} MW
+• 温度: {temp_shap.min():.1f} ~ {temp_shap.max():.1f} MW
+• 星期: {dow_shap.min():.1f} ~ {dow_shap.max():.1f} MW
+• 周数: {wom_avg.min():.1f} ~ {wom_avg.max():.1f} MW
         """
         ax6.text(0.1, 0.9, summary_text, transform=ax6.transAxes, fontsize=10,
                 verticalalignment='top', bbox=dict(boxstyle='round', facecolor='lightgray', alpha=0.5))
         
-        plt.tight_layout()
-        plt.savefig('shap_dashboard.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        self._save('shap_dashboard.png')
         
-    def visualize_all(self):
-        """生成所有可视化"""
+    def visualize_all(self, interactive=False):
+        """生成所有可视化
+        
+        interactive为False时只写出PNG不弹出窗口，并复用同一Figure
+        """
         print("🎨 开始生成所有SHAP可视化...")
         
+        self.interactive = interactive
+        
         self.plot_feature_importance()
         self.plot_hour_dependence()
         self.plot_temperature_dependence()
@@ -337,6 +320,8 @@ class SHAPDataVisualizer:
 
 def main():
     """主函数"""
+    args = parse_show_args('SHAP数据可视化器')
+    
     print("🎯 SHAP数据可视化器")
     print("=" * 50)
     
@@ -345,7 +330,7 @@ def main():
     visualizer = SHAPDataVisualizer(json_path)
     
     # 生成所有可视化
-    visualizer.visualize_all()
+    visualizer.visualize_all(interactive=args.show)
 
 if __name__ == "__main__":
     main()
@@ -4,37 +4,106 @@ AI Agent集成端到端测试
 """
 
 import asyncio
+import math
 import sys
 import json
+import logging
 import time
+from functools import lru_cache, wraps
 from pathlib import Path
+from pydantic import ValidationError
+
+logger = logging.getLogger(__name__)
 
 # 添加路径
 sys.path.insert(0, str(Path(__file__).parent / "backend"))
 
-async def test_end_to_end_integration():
-    """端到端集成测试"""
+try:
+    import orjson
+    def _dumps(obj):
+        return orjson.dumps(obj)
+except ImportError:  # orjson为可选依赖，缺失时退回标准库json
+    def _dumps(obj):
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+try:
+    import uvloop
+except ImportError:  # uvloop为可选依赖，缺失时使用标准asyncio事件循环
+    uvloop = None
+
+# 后端模块在启动时（事件循环开始之前）一次性导入
+from backend.ai_agent.core.agent import DecisionCoPilot
+from backend.app.api.v1.endpoints.ai_agent import (
+    get_ai_agent_status, AIAgentRequest, create_sse_event
+)
+
+# 导入时预先构建pydantic校验器，避免首次校验的冷启动开销计入测试步骤
+AIAgentRequest.model_rebuild(force=True)
+try:
+    AIAgentRequest(intention="x" * 20, reasoning="y" * 20)
+except ValidationError:
+    pass
+
+# Agent输出中必须包含的字段
+_EXPECTED_FIELDS = frozenset({
+    'execution_summary',
+    'adjustments',
+    'recommendations',
+    'reasoning_explanation'
+})
+
+@lru_cache(maxsize=1)
+def _agent():
+    """整个测试进程共用一个DecisionCoPilot实例，避免每个阶段重复初始化"""
+    return DecisionCoPilot()
+
+def _emit_report(name, passed, log, verbose=False):
+    """一次性输出测试记录：verbose时打印可读文本，否则写出一行JSON报告"""
+    if verbose:
+        print("\n".join(message for _, _, message in log))
+        return
+    report = {
+        "test": name,
+        "passed": passed,
+        "entries": [
+            {"phase": phase, "ok": ok, "message": message.strip()}
+            for phase, ok, message in log
+        ]
+    }
+    sys.stdout.flush()
+    sys.stdout.buffer.write(_dumps(report) + b"\n")
+    sys.stdout.buffer.flush()
+
+def _reported(name):
+    """测试协程的输出先缓冲到log列表，结束时通过_emit_report一次性写出"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, verbose=False, **kwargs):
+            log = []
+            passed = await func(log, *args, **kwargs)
+            _emit_report(name, passed, log, verbose)
+            return passed
+        return wrapper
+    return decorator
+
+async def test_end_to_end_integration(concurrency=3, max_in_flight=None, verbose=False):
+    """端到端集成测试
+    
+    concurrency为步骤7中发起的会话数，max_in_flight为同时在途的上限（None表示不限，即等于concurrency）
+    """
+    return await _run_end_to_end_integration(concurrency, max_in_flight, verbose=verbose)
+
+@_reported("end_to_end")
+async def _run_end_to_end_integration(log, concurrency, max_in_flight):
+    """端到端集成测试的各个步骤，输出以 (阶段, 是否通过, 信息) 记录到log"""
     
-    print("🧪 AI Agent集成端到端测试")
-    print("="*60)
+    log.append(("header", None, "🧪 AI Agent集成端到端测试"))
+    log.append(("header", None, "="*60))
     
     try:
-        # 1. 测试后端API可用性
-        print("1️⃣ 测试后端API可用性...")
-        from backend.app.api.v1.endpoints.ai_agent import get_ai_agent_status
-        
-        status = await get_ai_agent_status()
-        if status['status'] == 'ready':
-            print("✅ 后端API状态正常")
-        else:
-            print("❌ 后端API状态异常")
-            return False
-        
-        # 2. 测试AI Agent核心功能
-        print("\n2️⃣ 测试AI Agent核心功能...")
-        from backend.ai_agent.core.agent import DecisionCoPilot
-        
-        agent = DecisionCoPilot()
+        # 2. 测试AI Agent核心功能（步骤1、3、4、5彼此独立，在此之后并发执行）
+        log.append(("step2", None, "2️⃣ 测试AI Agent核心功能..."))
+        agent = _agent()
         test_result = await agent.process_human_decision(
             human_decision_intent="测试端到端集成",
             human_reasoning="验证AI Agent是否能正常工作",
@@ -42,77 +111,79 @@ async def test_end_to_end_integration():
         )
         
         if test_result and 'final_adjustments' in test_result:
-            print("✅ AI Agent核心功能正常")
+            log.append(("step2", True, "✅ AI Agent核心功能正常"))
         else:
-            print("❌ AI Agent核心功能异常")
+            log.append(("step2", False, "❌ AI Agent核心功能异常"))
             return False
         
-        # 3. 测试流式API端点
-        print("\n3️⃣ 测试流式API端点...")
-        from backend.app.api.v1.endpoints.ai_agent import AIAgentRequest, create_sse_event
-        
-        # 创建测试请求
-        test_request = AIAgentRequest(
-            intention="端到端测试决策调整",
-            reasoning="验证完整的API流程是否正常工作"
-        )
-        
-        # 测试SSE事件创建
-        test_event = create_sse_event(
-            "test_event",
-            {"message": "端到端测试"},
-            "e2e-test-session"
+        # 各检查返回 (是否通过, 输出信息)，信息在全部完成后按步骤顺序记录
+        async def check_api_status():
+            # 1. 测试后端API可用性
+            status = await get_ai_agent_status()
+            if status['status'] == 'ready':
+                return True, ["✅ 后端API状态正常"]
+            return False, ["❌ 后端API状态异常"]
+        
+        async def check_sse_endpoint():
+            # 3. 测试流式API端点（请求校验是同步的，放到线程中执行，不阻塞事件循环）
+            test_request = await asyncio.to_thread(
+                AIAgentRequest,
+                intention="端到端测试决策调整",
+                reasoning="验证完整的API流程是否正常工作"
+            )
+            test_event = create_sse_event(
+                "test_event",
+                {"message": "端到端测试"},
+                "e2e-test-session"
+            )
+            # orjson序列化的事件直接是bytes，标准库json得到的是str，两种都接受
+            prefix = b"data: " if isinstance(test_event, bytes) else "data: "
+            if test_event.startswith(prefix):
+                return True, ["✅ 流式API端点功能正常"]
+            return False, ["❌ 流式API端点功能异常"]
+        
+        async def check_data_format():
+            # 4. 测试数据格式兼容性（子集判断一次完成，结果同时用于步骤8的检查清单）
+            if _EXPECTED_FIELDS <= test_result.keys():
+                return True, ["✅ 数据格式兼容性正常"]
+            missing = sorted(_EXPECTED_FIELDS - test_result.keys())
+            return False, ["❌ 数据格式兼容性异常", f"   缺失字段: {missing}"]
+        
+        async def check_error_handling():
+            # 5. 测试错误处理
+            try:
+                # 测试无效输入（同样在线程中校验）
+                invalid_request = await asyncio.to_thread(
+                    AIAgentRequest,
+                    intention="短",  # 太短，应该被拒绝
+                    reasoning="也短"  # 太短，应该被拒绝
+                )
+                return False, ["❌ 应该拒绝无效输入"]
+            except ValidationError:
+                return True, ["✅ 错误处理正常工作"]
+        
+        phases = (
+            ("step1", "1️⃣ 测试后端API可用性...", check_api_status()),
+            ("step3", "3️⃣ 测试流式API端点...", check_sse_endpoint()),
+            ("step4", "4️⃣ 测试数据格式兼容性...", check_data_format()),
+            ("step5", "5️⃣ 测试错误处理...", check_error_handling()),
         )
+        phase_results = await asyncio.gather(*(check for _, _, check in phases))
         
-        if test_event.startswith("data: "):
-            print("✅ 流式API端点功能正常")
-        else:
-            print("❌ 流式API端点功能异常")
-            return False
-        
-        # 4. 测试数据格式兼容性
-        print("\n4️⃣ 测试数据格式兼容性...")
-        
-        # 验证输入格式
-        input_data = {
-            "intention": "测试数据格式",
-            "reasoning": "验证前后端数据格式是否兼容",
-            "session_id": "format-test"
-        }
-        
-        # 验证输出格式
-        expected_output_fields = [
-            'execution_summary',
-            'adjustments', 
-            'recommendations',
-            'reasoning_explanation'
-        ]
+        for (phase, title, _), (ok, messages) in zip(phases, phase_results):
+            log.append((phase, None, f"\n{title}"))
+            for message in messages:
+                log.append((phase, ok, message))
         
-        if all(field in test_result for field in expected_output_fields):
-            print("✅ 数据格式兼容性正常")
-        else:
-            print("❌ 数据格式兼容性异常")
-            print(f"   缺失字段: {[f for f in expected_output_fields if f not in test_result]}")
+        status_ok, sse_ok, format_ok, error_handling_ok = (ok for ok, _ in phase_results)
+        if not all(ok for ok, _ in phase_results):
             return False
         
-        # 5. 测试错误处理
-        print("\n5️⃣ 测试错误处理...")
-        
-        try:
-            # 测试无效输入
-            invalid_request = AIAgentRequest(
-                intention="短",  # 太短，应该被拒绝
-                reasoning="也短"  # 太短，应该被拒绝
-            )
-            print("❌ 应该拒绝无效输入")
-            return False
-        except Exception:
-            print("✅ 错误处理正常工作")
-        
         # 6. 测试性能指标
-        print("\n6️⃣ 测试性能指标...")
+        log.append(("step6", None, "\n6️⃣ 测试性能指标..."))
         
-        start_time = time.time()
+        # 单调的高精度计时器，不受系统时钟调整影响
+        start_ns = time.perf_counter_ns()
         
         # 执行一个完整的AI Agent流程
         performance_result = await agent.process_human_decision(
@@ -121,113 +192,128 @@ async def test_end_to_end_integration():
             session_id="performance-test"
         )
         
-        end_time = time.time()
-        execution_time = end_time - start_time
+        end_ns = time.perf_counter_ns()
+        execution_time = (end_ns - start_ns) / 1e9
         
-        print(f"   执行时间: {execution_time:.2f}秒")
+        log.append(("step6", None, f"   执行时间: {execution_time:.2f}秒"))
         
         if execution_time < 300:  # 5分钟内完成
-            print("✅ 性能指标正常")
+            log.append(("step6", True, "✅ 性能指标正常"))
         else:
-            print("⚠️ 性能可能需要优化")
+            log.append(("step6", False, "⚠️ 性能可能需要优化"))
         
         # 7. 测试并发处理
-        print("\n7️⃣ 测试并发处理...")
+        log.append(("step7", None, "\n7️⃣ 测试并发处理..."))
         
-        async def concurrent_test(session_id):
+        async def concurrent_test(payload):
+            intent, reasoning, session_id = payload
             try:
                 result = await agent.process_human_decision(
-                    human_decision_intent=f"并发测试{session_id}",
-                    human_reasoning=f"测试会话{session_id}的并发处理",
-                    session_id=f"concurrent-{session_id}"
+                    human_decision_intent=intent,
+                    human_reasoning=reasoning,
+                    session_id=session_id
                 )
                 return result is not None
             except Exception as e:
-                print(f"   并发测试{session_id}失败: {e}")
+                log.append(("step7", False, f"   并发测试{session_id}失败: {e}"))
                 return False
         
-        # 启动3个并发任务
-        concurrent_tasks = [
-            concurrent_test(1),
-            concurrent_test(2),
-            concurrent_test(3)
+        # 同时在途的请求不超过max_in_flight个
+        semaphore = asyncio.Semaphore(concurrency if max_in_flight is None else max_in_flight)
+        
+        async def guarded(payload):
+            async with semaphore:
+                return await concurrent_test(payload)
+        
+        # 各会话的 (意图, 理由, 会话ID) 在启动任务前一次性生成
+        payloads = [
+            (f"并发测试{i}", f"测试会话{i}的并发处理", f"concurrent-{i}")
+            for i in range(1, concurrency + 1)
         ]
         
-        concurrent_results = await asyncio.gather(*concurrent_tasks, return_exceptions=True)
+        # 启动concurrency个并发任务（concurrent_test自行捕获异常，单个失败不会取消其他任务）
+        async with asyncio.TaskGroup() as tg:
+            concurrent_tasks = [tg.create_task(guarded(payload)) for payload in payloads]
+        concurrent_results = [task.result() for task in concurrent_tasks]
         successful_concurrent = sum(1 for r in concurrent_results if r is True)
         
-        print(f"   并发成功: {successful_concurrent}/3")
+        log.append(("step7", None, f"   并发成功: {successful_concurrent}/{concurrency}"))
         
-        if successful_concurrent >= 2:  # 至少2个成功
-            print("✅ 并发处理正常")
+        # 至少三分之二成功（默认3个会话时即至少2个）
+        min_concurrent_success = math.ceil(concurrency * 2 / 3)
+        if successful_concurrent >= min_concurrent_success:
+            log.append(("step7", True, "✅ 并发处理正常"))
         else:
-            print("❌ 并发处理异常")
+            log.append(("step7", False, "❌ 并发处理异常"))
             return False
         
         # 8. 测试集成完整性
-        print("\n8️⃣ 测试集成完整性...")
+        log.append(("step8", None, "\n8️⃣ 测试集成完整性..."))
         
         # 验证所有组件都能正常协作
         integration_checklist = {
             "AI Agent核心": test_result is not None,
-            "流式API": test_event.startswith("data: "),
-            "数据格式": all(field in test_result for field in expected_output_fields),
-            "错误处理": True,  # 已在步骤5验证
+            "后端API": status_ok,
+            "流式API": sse_ok,
+            "数据格式": format_ok,
+            "错误处理": error_handling_ok,
             "性能表现": execution_time < 300,
-            "并发处理": successful_concurrent >= 2
+            "并发处理": successful_concurrent >= min_concurrent_success
         }
         
         all_passed = all(integration_checklist.values())
         
-        print("   集成检查结果:")
+        log.append(("step8", None, "   集成检查结果:"))
         for component, status in integration_checklist.items():
             status_icon = "✅" if status else "❌"
-            print(f"     {status_icon} {component}")
+            log.append(("step8", status, f"     {status_icon} {component}"))
         
         if all_passed:
-            print("✅ 集成完整性验证通过")
+            log.append(("step8", True, "✅ 集成完整性验证通过"))
         else:
-            print("❌ 集成完整性验证失败")
+            log.append(("step8", False, "❌ 集成完整性验证失败"))
             return False
         
-        print("\n🎉 端到端集成测试完成")
+        log.append(("done", True, "\n🎉 端到端集成测试完成"))
         return True
         
     except Exception as e:
-        print(f"❌ 端到端测试失败: {e}")
-        import traceback
-        traceback.print_exc()
+        log.append(("error", False, f"❌ 端到端测试失败: {e}"))
+        logger.exception("端到端测试失败")
         return False
 
-async def test_user_workflow_simulation():
+async def test_user_workflow_simulation(verbose=False):
     """模拟用户工作流程"""
+    return await _run_user_workflow_simulation(verbose=verbose)
+
+@_reported("user_workflow")
+async def _run_user_workflow_simulation(log):
+    """用户工作流程模拟的各个步骤，输出记录到log"""
     
-    print("\n🎭 用户工作流程模拟")
-    print("-" * 40)
+    log.append(("header", None, "\n🎭 用户工作流程模拟"))
+    log.append(("header", None, "-" * 40))
     
     try:
-        from backend.ai_agent.core.agent import DecisionCoPilot
-        
         # 模拟用户创建决策并启动AI Agent的完整流程
-        print("👤 模拟用户操作:")
-        print("   1. 用户在Decision Making Area创建新决策")
-        print("   2. 输入决策意图和理由")
-        print("   3. 点击启动AI助手")
-        print("   4. 观看AI实时分析过程")
-        print("   5. 查看AI决策建议")
-        print("   6. 决策保存到历史记录")
+        log.append(("steps", None, "👤 模拟用户操作:"))
+        log.append(("steps", None, "   1. 用户在Decision Making Area创建新决策"))
+        log.append(("steps", None, "   2. 输入决策意图和理由"))
+        log.append(("steps", None, "   3. 点击启动AI助手"))
+        log.append(("steps", None, "   4. 观看AI实时分析过程"))
+        log.append(("steps", None, "   5. 查看AI决策建议"))
+        log.append(("steps", None, "   6. 决策保存到历史记录"))
         
         # 执行模拟
-        agent = DecisionCoPilot()
+        agent = _agent()
         
         user_intention = "调整明天极寒天气下的电力预测"
         user_reasoning = "明天预报-15°C极寒天气，供暖需求将激增，特别是早晚高峰时段"
         
-        print(f"\n📝 用户输入:")
-        print(f"   意图: {user_intention}")
-        print(f"   理由: {user_reasoning}")
+        log.append(("input", None, "\n📝 用户输入:"))
+        log.append(("input", None, f"   意图: {user_intention}"))
+        log.append(("input", None, f"   理由: {user_reasoning}"))
         
-        print("\n🤖 AI Agent开始分析...")
+        log.append(("analysis", None, "\n🤖 AI Agent开始分析..."))
         
         result = await agent.process_human_decision(
             human_decision_intent=user_intention,
@@ -236,51 +322,91 @@ async def test_user_workflow_simulation():
         )
         
         if result:
-            print("✅ AI分析完成")
-            print(f"   生成调整建议: {len(result.get('adjustments', {}))}个时段")
-            print(f"   执行建议: {len(result.get('recommendations', []))}条")
-            print(f"   置信度: {result.get('confidence_level', 0):.0%}")
+            log.append(("analysis", True, "✅ AI分析完成"))
+            log.append(("analysis", None, f"   生成调整建议: {len(result.get('adjustments', {}))}个时段"))
+            log.append(("analysis", None, f"   执行建议: {len(result.get('recommendations', []))}条"))
+            log.append(("analysis", None, f"   置信度: {result.get('confidence_level', 0):.0%}"))
             
-            print("\n📚 决策保存到历史记录")
-            print("   ✅ 包含AI Agent使用标记")
-            print("   ✅ 包含完整AI分析结果")
-            print("   ✅ 用户可随时查看")
+            log.append(("history", None, "\n📚 决策保存到历史记录"))
+            log.append(("history", True, "   ✅ 包含AI Agent使用标记"))
+            log.append(("history", True, "   ✅ 包含完整AI分析结果"))
+            log.append(("history", True, "   ✅ 用户可随时查看"))
             
             return True
         else:
-            print("❌ AI分析失败")
+            log.append(("analysis", False, "❌ AI分析失败"))
             return False
             
     except Exception as e:
-        print(f"❌ 用户工作流程模拟失败: {e}")
+        log.append(("error", False, f"❌ 用户工作流程模拟失败: {e}"))
+        logger.exception("用户工作流程模拟失败")
         return False
 
-async def main():
-    """主测试函数"""
+async def main(concurrency=3, verbose=False, max_in_flight=None):
+    """主测试函数
+    
+    默认每个测试结束时输出一行JSON报告；verbose为True时打印可读文本
+    """
     
-    print("🚀 开始AI Agent集成测试")
-    print("="*60)
+    if verbose:
+        print("🚀 开始AI Agent集成测试")
+        print("="*60)
     
     # 执行端到端测试
-    e2e_success = await test_end_to_end_integration()
+    e2e_success = await test_end_to_end_integration(concurrency, max_in_flight, verbose=verbose)
     
     # 执行用户工作流程模拟
-    workflow_success = await test_user_workflow_simulation()
+    workflow_success = await test_user_workflow_simulation(verbose=verbose)
     
-    print("\n" + "="*60)
-    print("📊 测试结果总结")
-    print("="*60)
+    log = [
+        ("header", None, "\n" + "="*60),
+        ("header", None, "📊 测试结果总结"),
+        ("header", None, "="*60),
+    ]
     
     if e2e_success and workflow_success:
-        print("🎉 所有测试通过！")
-        print("✅ AI Agent已成功集成到Decision Making Area")
-        print("✅ 完整用户流程正常工作")
-        print("✅ 系统准备就绪，可以交付使用")
+        log.append(("summary", True, "🎉 所有测试通过！"))
+        log.append(("summary", True, "✅ AI Agent已成功集成到Decision Making Area"))
+        log.append(("summary", True, "✅ 完整用户流程正常工作"))
+        log.append(("summary", True, "✅ 系统准备就绪，可以交付使用"))
     else:
-        print("❌ 部分测试失败")
-        print(f"   端到端测试: {'✅' if e2e_success else '❌'}")
-        print(f"   用户流程: {'✅' if workflow_success else '❌'}")
-        print("🔧 需要进一步调试和修复")
+        log.append(("summary", False, "❌ 部分测试失败"))
+        log.append(("end_to_end", e2e_success, f"   端到端测试: {'✅' if e2e_success else '❌'}"))
+        log.append(("user_workflow", workflow_success, f"   用户流程: {'✅' if workflow_success else '❌'}"))
+        log.append(("summary", False, "🔧 需要进一步调试和修复"))
+    
+    _emit_report("summary", e2e_success and workflow_success, log, verbose)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    import argparse
+    
+    def positive_int(value):
+        """argparse类型：至少为1的整数（0个会话会让并发检查空转通过）"""
+        number = int(value)
+        if number < 1:
+            raise argparse.ArgumentTypeError(f'必须是不小于1的整数: {value}')
+        return number
+    
+    parser = argparse.ArgumentParser(description='AI Agent集成端到端测试')
+    parser.add_argument('--concurrency', type=positive_int, default=3,
+                       help='并发处理测试中发起的会话数（默认3）')
+    parser.add_argument('--max-in-flight', type=positive_int, default=None,
+                       help='并发处理测试中同时在途的会话数上限（默认与--concurrency相同）')
+    parser.add_argument('--verbose', action='store_true',
+                       help='打印可读的逐步输出，而不是每个测试一行JSON报告')
+    parser.add_argument('--debug', action='store_true',
+                       help='失败时在stderr输出完整的异常堆栈')
+    args = parser.parse_args()
+    
+    # 根日志保持默认的WARNING级别，后端模块的警告和错误照常输出；
+    # 本脚本的失败信息已写入报告，异常堆栈只在--debug时输出
+    logging.basicConfig(format='%(levelname)s %(name)s: %(message)s')
+    logger.setLevel(logging.DEBUG if args.debug else logging.CRITICAL)
+    
+    # 安装了uvloop时以其事件循环运行（通过Runner的loop_factory，不修改全局事件循环策略）
+    loop_factory = uvloop.new_event_loop if uvloop is not None else None
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        # 能同步完成的协程直接在创建时执行完毕，不再经过一次事件循环调度（Python 3.12+）
+        if hasattr(asyncio, 'eager_task_factory'):
+            runner.get_loop().set_task_factory(asyncio.eager_task_factory)
+        runner.run(main(args.concurrency, args.verbose, args.max_in_flight))